@@ -26,6 +26,7 @@ Output is sent to stdout.
 __author__ = 'nnorwitz@google.com (Neal Norwitz)'
 
 
+import functools
 import os
 import re
 import sys
@@ -34,16 +35,42 @@ import argparse
 from cpp import ast
 from cpp import utils
 
-# Preserve compatibility with Python 2.3.
-try:
-  _dummy = set
-except NameError:
-  import sets
-  set = sets.Set
-
 _VERSION = (1, 1, 0)  # The version of this script.
 # How many spaces to indent.  Can set me with the INDENT environment variable.
 _INDENT = 2
+# Indent strings derived from _INDENT, built once here instead of per
+# method; _SetIndent refreshes them when the environment overrides the
+# default.
+_INDENT_STR = ' ' * _INDENT
+_HALF_INDENT_STR = ' ' * (_INDENT // 2)
+_TRIPLE_INDENT_STR = _INDENT_STR * 3
+
+
+def _SetIndent(indent):
+  global _INDENT, _INDENT_STR, _HALF_INDENT_STR, _TRIPLE_INDENT_STR
+  _INDENT = indent
+  _INDENT_STR = ' ' * indent
+  _HALF_INDENT_STR = ' ' * (indent // 2)
+  _TRIPLE_INDENT_STR = _INDENT_STR * 3
+
+# Function modifier masks used to pick out mockable methods.
+_FUNCTION_TYPE_MASK = (ast.FUNCTION_VIRTUAL | ast.FUNCTION_PURE_VIRTUAL |
+                       ast.FUNCTION_OVERRIDE)
+_CTOR_DTOR_MASK = ast.FUNCTION_CTOR | ast.FUNCTION_DTOR
+
+# Matches a // comment or a whitespace run in a parameter list.  Compiled
+# once here so the per-method loop in _GenerateMethods does not re-enter the
+# re cache on every call.  The comment branch also eats the whitespace
+# before the comment, so the newline after it supplies the single
+# separating space.
+_PARAM_CLEAN_RE = re.compile(r'\s*//[^\n]*|\s{2,}|\n')
+
+
+def _CleanParamText(match):
+  """Replacement for _PARAM_CLEAN_RE: drop comments, squash whitespace."""
+  if '//' in match.group(0):
+    return ''
+  return ' '
 
 
 def _CompatibleNamespace(derived, parent):
@@ -58,41 +85,109 @@ def _CompatibleNamespace(derived, parent):
     they are compatible. This is not a very strict check, but for many programs it will work.
 
   """
-  return cmp(derived.namespace[0:len(parent.namespace)], parent.namespace) == 0
+  derived_namespace = derived.namespace
+  parent_namespace = parent.namespace
+  if len(derived_namespace) < len(parent_namespace):
+    return False
+  for derived_part, parent_part in zip(derived_namespace, parent_namespace):
+    if derived_part != parent_part:
+      return False
+  return True
+
+
+@functools.lru_cache(maxsize=16)
+def _TemplateArgs(count):
+  """
+
+  Args:
+    count: The number of template arguments the class takes.
+
+  Returns:
+    A ('typename T0, typename T1, ...', 'T0, T1, ...') pair for the
+    template declaration and argument lists.  Memoized, since templated
+    classes mostly share the same few arities.
+
+  """
+  args = [f'T{n}' for n in range(count)]
+  return ', '.join('typename ' + arg for arg in args), ', '.join(args)
 
 
-def _BaseClass(class_node, base_type, ast_list):
+def _BuildClassIndex(ast_list):
   """
 
   Args:
-    class_node: The Class node to examine.
-    parent: The Type node for a base class, from the child class's node.bases.
     ast_list: The AST for the entire file.
 
   Returns:
-    The Class node for the base class, if any.
+    A dict mapping class name to the Class nodes (with bodies) of that name,
+    so base-class lookups don't have to rescan the whole AST.
 
   """
+  class_index = {}
   for node in ast_list:
-    if isinstance(node, ast.Class) and node.body and node.name == base_type.name and _CompatibleNamespace(class_node, node):
+    if isinstance(node, ast.Class) and node.body:
+      class_index.setdefault(node.name, []).append(node)
+  return class_index
+
+
+def _BaseClass(class_node, base_type, class_index):
+  """
+
+  Args:
+    class_node: The Class node to examine.
+    base_type: The Type node for a base class, from the child class's
+        node.bases.
+    class_index: Class nodes indexed by name, from _BuildClassIndex.
+
+  Returns:
+    The Class node for the base class, if any.
+
+  """
+  for node in class_index.get(base_type.name, ()):
+    if _CompatibleNamespace(class_node, node):
       return node
   return None
 
 
-def _GenerateMethods(output_lines, source, class_node, ast_list, seen, do_bases):
-  function_type = (ast.FUNCTION_VIRTUAL | ast.FUNCTION_PURE_VIRTUAL |
-                   ast.FUNCTION_OVERRIDE)
-  ctor_or_dtor = ast.FUNCTION_CTOR | ast.FUNCTION_DTOR
-  indent = ' ' * _INDENT
+def _GenerateMethods(output_lines, source, class_node, class_index, seen,
+                     do_bases, method_cache=None):
+  indent = _INDENT_STR
+  triple_indent = _TRIPLE_INDENT_STR
+  tmpl = ''
+  if class_node.templated_types:
+    tmpl = '_T'
+
+  # In diamond hierarchies the same base is reached more than once; the
+  # text generated for a class's own methods only depends on the class, so
+  # cache it and let `seen` do the per-derived-class dedup on replay.
+  if method_cache is None:
+    method_cache = {}
+  entries = method_cache.get(id(class_node))
+  if entries is None:
+    entries = []
+    for node in class_node.body:
+      # We only care about virtual functions; most body nodes are not, so
+      # bail out before doing any more work on them.
+      if not isinstance(node, ast.Function):
+        continue
+      mods = node.modifiers
+      if not mods & _FUNCTION_TYPE_MASK or mods & _CTOR_DTOR_MASK:
+        continue
 
-  for node in class_node.body:
-    # We only care about virtual functions.
-    if (isinstance(node, ast.Function) and
-        node.modifiers & function_type and
-        not node.modifiers & ctor_or_dtor):
       # Pick out all the elements we need from the original function.
+      # Slice the parameter text out of the source once; it is needed both
+      # for the (void) probe and for reconstructing the argument list.
+      params = node.parameters
+      num_parameters = len(params)
+      params_text = ''
+      if params:
+        params_text = source[params[0].start:params[-1].end]
+        if num_parameters == 1 and params_text.strip() == 'void':
+          # We must treat T(void) as a function with no parameters.
+          num_parameters = 0
+      warnings = []
       const = ''
-      if node.modifiers & ast.FUNCTION_CONST:
+      if mods & ast.FUNCTION_CONST:
         const = 'CONST_'
       return_type = 'void'
       if node.return_type:
@@ -109,24 +204,15 @@ def _GenerateMethods(output_lines, source, class_node, ast_list, seen, do_bases)
                 '// The following line won\'t really compile, as the return',
                 '// type has multiple template arguments.  To fix it, use a',
                 '// typedef for the return type.']:
-              output_lines.append(indent + line)
+              warnings.append(indent + line)
         if node.return_type.pointer:
           return_type += '*'
         if node.return_type.reference:
           return_type += '&'
-        num_parameters = len(node.parameters)
-        if len(node.parameters) == 1:
-          first_param = node.parameters[0]
-          if source[first_param.start:first_param.end].strip() == 'void':
-            # We must treat T(void) as a function with no parameters.
-            num_parameters = 0
-      tmpl = ''
-      if class_node.templated_types:
-        tmpl = '_T'
-      mock_method_macro = 'MOCK_%sMETHOD%d%s' % (const, num_parameters, tmpl)
+      mock_method_macro = f'MOCK_{const}METHOD{num_parameters}{tmpl}'
 
       args = ''
-      if node.parameters:
+      if params:
         # Due to the parser limitations, it is impossible to keep comments
         # while stripping the default parameters.  When defaults are
         # present, we choose to strip them and comments (and produce
@@ -134,44 +220,48 @@ def _GenerateMethods(output_lines, source, class_node, ast_list, seen, do_bases)
         # TODO(nnorwitz@google.com): Investigate whether it is possible to
         # preserve parameter name when reconstructing parameter text from
         # the AST.
-        if len([param for param in node.parameters if param.default]) > 0:
-          args = ', '.join(param.type.name for param in node.parameters)
+        if any(param.default for param in params):
+          args = ', '.join(param.type.name for param in params)
         else:
-          # Get the full text of the parameters from the start
-          # of the first parameter to the end of the last parameter.
-          start = node.parameters[0].start
-          end = node.parameters[-1].end
-          # Remove // comments.
-          args_strings = re.sub(r'//.*', '', source[start:end])
-          # Condense multiple spaces and eliminate newlines putting the
-          # parameters together on a single line.  Ensure there is a
-          # space in an argument which is split by a newline without
-          # intervening whitespace, e.g.: int\nBar
-          args = re.sub('  +', ' ', args_strings.replace('\n', ' '))
+          # Remove // comments, condense whitespace, and put the
+          # parameters together on a single line, all in one pass over
+          # the text.  Whitespace runs collapse to a single space, so an
+          # argument split by a newline without intervening whitespace
+          # (e.g.: int\nBar) keeps a space in it.
+          args = _PARAM_CLEAN_RE.sub(_CleanParamText, params_text).strip()
 
       # Create the mock method definition.
-      decl = '%s%s(%s,' % (indent, mock_method_macro, node.name)
-      args = '%s%s(%s));' % (indent * 3, return_type, args)
-      # Do not re-generate a mock for something we've printed before.
-      if not seen.has_key(decl+args):
-        output_lines.extend([decl, args])
-        seen[decl+args] = True
-
-  try:
-    if do_bases:
-      # Generate mocks for inherited functions.
-      for base_type in class_node.bases:
-        base_class = _BaseClass(class_node, base_type, ast_list)
-        if base_class:
-          output_lines.extend(["%s// Inherited from %s" % (indent, base_class.FullName())])
-          _GenerateMethods(output_lines, source, base_class, ast_list, seen, do_bases)
-  except:
-    pass
-
-
-def _GenerateMocks(filename, source, ast_list, desired_class_names, do_bases=True):
+      decl = f'{indent}{mock_method_macro}({node.name},'
+      args = f'{triple_indent}{return_type}({args}));'
+      entries.append((warnings, decl, args))
+    method_cache[id(class_node)] = entries
+
+  for warnings, decl, args in entries:
+    output_lines.extend(warnings)
+    # Do not re-generate a mock for something we've printed before.
+    key = (decl, args)
+    if key not in seen:
+      output_lines.extend([decl, args])
+      seen.add(key)
+
+  # Generate mocks for inherited functions.  bases is None (not an empty
+  # list) when the class declares none, which is all the bare try/except
+  # that used to sit here ever had to swallow.
+  if do_bases and class_node.bases:
+    for base_type in class_node.bases:
+      base_class = _BaseClass(class_node, base_type, class_index)
+      if base_class:
+        output_lines.append(f'{indent}// Inherited from {base_class.FullName()}')
+        _GenerateMethods(output_lines, source, base_class, class_index, seen,
+                         do_bases, method_cache)
+
+
+def _GenerateMocks(filename, source, ast_list, desired_class_names, writer,
+                   do_bases=True):
   processed_class_names = set()
-  lines = []
+  first_class = True
+  class_index = _BuildClassIndex(ast_list)
+  method_cache = {}
   for node in ast_list:
     if (isinstance(node, ast.Class) and node.body and
         # desired_class_names being None means that all classes are selected.
@@ -180,10 +270,24 @@ def _GenerateMocks(filename, source, ast_list, desired_class_names, do_bases=Tru
       parent_name = class_name
       processed_class_names.add(class_name)
       class_node = node
+
+      # Generate the methods first so we know whether a public label is
+      # needed before the class prolog is written out.
+      method_lines = []
+      _GenerateMethods(method_lines, source, class_node, class_index, set(),
+                       do_bases, method_cache)
+
+      # Add an extra newline between classes.
+      if not first_class:
+        writer.write('\n')
+      first_class = False
+
       # Add namespace before the class.
-      if class_node.namespace:
-        lines.extend(['namespace %s {' % n for n in class_node.namespace])  # }
-        lines.append('')
+      namespace = class_node.namespace
+      if namespace:
+        for n in namespace:
+          writer.write(f'namespace {n} {{\n')  # }
+        writer.write('\n')
 
       # Add template args for templated classes.
       if class_node.templated_types:
@@ -192,34 +296,29 @@ def _GenerateMocks(filename, source, ast_list, desired_class_names, do_bases=Tru
         # TODO(paulchang): Handle non-type template arguments (e.g.
         # template<typename T, int N>).
         template_arg_count = len(class_node.templated_types.keys())
-        template_args = ['T%d' % n for n in range(template_arg_count)]
-        template_decls = ['typename ' + arg for arg in template_args]
-        lines.append('template <' + ', '.join(template_decls) + '>')
-        parent_name += '<' + ', '.join(template_args) + '>'
+        template_decls, template_args = _TemplateArgs(template_arg_count)
+        writer.write('template <' + template_decls + '>\n')
+        parent_name += '<' + template_args + '>'
 
       # Add the class prolog.
-      lines.append('class Mock%s : public %s {'  # }
-                   % (class_name, parent_name))
-      lines.append('%spublic:' % (' ' * (_INDENT // 2)))
+      writer.write('class Mock%s : public %s {\n'  # }
+                % (class_name, parent_name))
 
-      # Add all the methods.
-      _GenerateMethods(lines, source, class_node, ast_list, {}, do_bases)
+      # If there are no virtual methods, no need for a public label.
+      if method_lines:
+        writer.write(_HALF_INDENT_STR + 'public:\n')
+        for line in method_lines:
+          writer.write(line)
+          writer.write('\n')
 
       # Close the class.
-      if lines:
-        # If there are no virtual methods, no need for a public label.
-        if len(lines) == 2:
-          del lines[-1]
-
-        # Only close the class if there really is a class.
-        lines.append('};')
-        lines.append('')  # Add an extra newline.
+      writer.write('};\n')
 
       # Close the namespace.
-      if class_node.namespace:
-        for i in range(len(class_node.namespace)-1, -1, -1):
-          lines.append('}  // namespace %s' % class_node.namespace[i])
-        lines.append('')  # Add an extra newline.
+      if namespace:
+        writer.write('\n')
+        for n in reversed(namespace):
+          writer.write(f'}}  // namespace {n}\n')
 
   if desired_class_names:
     missing_class_name_list = list(desired_class_names - processed_class_names)
@@ -230,8 +329,6 @@ def _GenerateMocks(filename, source, ast_list, desired_class_names, do_bases=Tru
   elif not processed_class_names:
     sys.stderr.write('No class found in %s\n' % filename)
 
-  return lines
-
 
 def main(argv=sys.argv):
   parser = argparse.ArgumentParser(description="Simple generator for gmock functions", epilog=__doc__)
@@ -245,9 +342,8 @@ def main(argv=sys.argv):
     parser.print_help()
     return 1
 
-  global _INDENT
   try:
-    _INDENT = int(os.environ['INDENT'])
+    _SetIndent(int(os.environ['INDENT']))
   except KeyError:
     pass
   except:
@@ -262,15 +358,17 @@ def main(argv=sys.argv):
 
   builder = ast.BuilderFromSource(source, filename)
   try:
-    entire_ast = filter(None, builder.Generate())
+    entire_ast = [node for node in builder.Generate() if node]
   except KeyboardInterrupt:
     return
   except:
     # An error message was already printed since we couldn't parse.
     sys.exit(1)
   else:
-    lines = _GenerateMocks(filename, source, entire_ast, desired_class_names, do_bases)
-    sys.stdout.write('\n'.join(lines))
+    # Stream each class block straight to stdout instead of accumulating
+    # the whole output in memory first.
+    _GenerateMocks(filename, source, entire_ast, desired_class_names,
+                   sys.stdout, do_bases)
 
 
 if __name__ == '__main__':
@@ -20,6 +20,7 @@
 __author__ = 'nnorwitz@google.com (Neal Norwitz)'
 
 
+import io
 import os
 import sys
 import unittest
@@ -51,7 +52,8 @@ class GenerateMethodsTest(TestCase):
     # <test> is a pseudo-filename, it is not read or written.
     builder = ast.BuilderFromSource(cpp_source, '<test>')
     ast_list = list(builder.Generate())
-    gmock_class._GenerateMethods(method_source_lines, cpp_source, ast_list[0], ast_list, {}, True)
+    class_index = gmock_class._BuildClassIndex(ast_list)
+    gmock_class._GenerateMethods(method_source_lines, cpp_source, ast_list[0], class_index, set(), True)
     return '\n'.join(method_source_lines)
 
   def testSimpleMethod(self):
@@ -320,8 +322,9 @@ class GenerateMocksTest(TestCase):
     filename = '<test>'
     builder = ast.BuilderFromSource(cpp_source, filename)
     ast_list = list(builder.Generate())
-    lines = gmock_class._GenerateMocks(filename, cpp_source, ast_list, None, do_base)
-    return '\n'.join(lines)
+    writer = io.StringIO()
+    gmock_class._GenerateMocks(filename, cpp_source, ast_list, None, writer, do_base)
+    return writer.getvalue()
 
   def testNamespaces(self):
     source = """